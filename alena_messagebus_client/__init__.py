@@ -8,7 +8,13 @@
 
 from .client.client import MessageBusClient
 from .message import Message
-from .send_message import send
+from .send_message import send, send_many
 from .conf import client_from_config
 
-__all__ = ["MessageBusClient", "Message", "send", "client_from_config"]
+__all__ = [
+    "MessageBusClient",
+    "Message",
+    "send",
+    "send_many",
+    "client_from_config",
+]
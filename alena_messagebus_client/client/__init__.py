@@ -1,3 +1,11 @@
 from .client import MessageBusClient, MessageCollector, MessageWaiter
+from .aclient import AsyncMessageBusClient
+from .emitter import DirectEmitter
 
-__all__ = ["MessageBusClient", "MessageCollector", "MessageWaiter"]
+__all__ = [
+    "MessageBusClient",
+    "MessageCollector",
+    "MessageWaiter",
+    "AsyncMessageBusClient",
+    "DirectEmitter",
+]
@@ -0,0 +1,224 @@
+"""
+Асинхронный клиент платформенной шины.
+
+Работает в одном потоке поверх цикла событий `asyncio`, соединение
+обслуживается пакетом `websockets`. Формат сообщений тот же, что и у
+`MessageBusClient`.
+"""
+import asyncio
+import inspect
+import logging
+import time
+
+try:
+    import websockets
+except ImportError:  # pragma: no cover
+    websockets = None
+
+from alena_messagebus_client.message import Message
+
+from .client import RETRY_MIN, MessageBusClient, MessageBusClientConf
+
+LOG = logging.getLogger(__name__)
+
+
+class AsyncMessageBusClient:
+    """Асинхронный клиент платформы виртуального ассистента.
+
+    Обработчики регистрируются так же, как в `MessageBusClient`. Обычные
+    функции вызываются непосредственно в цикле событий, корутины
+    запускаются отдельными задачами, поэтому долгий обработчик не
+    задерживает чтение из сокета.
+    """
+
+    def __init__(
+        self,
+        host: str = "0.0.0.0",
+        port: int = 8181,
+        route: str = "/core",
+        ssl: bool = False,
+    ):
+        if websockets is None:
+            raise ImportError(
+                "Для AsyncMessageBusClient необходим пакет websockets"
+            )
+        self.config = MessageBusClientConf(host, port, route, ssl)
+        self.url = MessageBusClient.build_url(host, port, route, ssl)
+        self.retry = RETRY_MIN
+        self.connect_attempts = 0
+        self._connected_since = None
+        self.connected_event = asyncio.Event()
+        self.handlers = {}
+        self._ws = None
+        self._closed = False
+        self._tasks = set()
+
+    # Та же задержка переподключения с разбросом, что и у
+    # `MessageBusClient`: метод использует только `retry`,
+    # `connect_attempts` и `_connected_since`.
+    _next_retry_delay = MessageBusClient._next_retry_delay
+
+    def on(self, event_name: str, func: callable):
+        """Регистрирует обработчик события.
+
+        Args:
+            event_name (str): Тип сообщения.
+            func (callable): функция или корутина.
+        """
+        self.handlers.setdefault(event_name, {})[func] = func
+
+    def once(self, event_name: str, func: callable):
+        """Регистрирует обработчик для разового вызова.
+
+        Args:
+            event_name (str): Тип сообщения.
+            func (callable): функция или корутина.
+        """
+
+        def wrapper(*args):
+            self.remove(event_name, func)
+            return func(*args)
+
+        self.handlers.setdefault(event_name, {})[func] = wrapper
+
+    def remove(self, event_name: str, func: callable):
+        """Удаляет обработчик события.
+
+        Args:
+            event_name (str): Тип сообщения.
+            func (callable): ранее зарегистрированный обработчик.
+        """
+        handlers = self.handlers.get(event_name)
+        if not handlers or handlers.pop(func, None) is None:
+            LOG.debug("Не удалось найти '%s'", event_name)
+            return
+        if not handlers:
+            del self.handlers[event_name]
+
+    def _dispatch(self, event_name: str, *args) -> None:
+        for func in list(self.handlers.get(event_name, {}).values()):
+            try:
+                result = func(*args)
+            except Exception:
+                LOG.exception("Ошибка в обработчике '%s'", event_name)
+                continue
+            if inspect.isawaitable(result):
+                task = asyncio.ensure_future(result)
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def on_message(self, message: str | bytes) -> None:
+        """Обрабатывает входящее сообщение.
+
+        Args:
+            message (str | bytes): сериализованное сообщение платформы.
+        """
+        parsed_message = Message.deserialize(message)
+        self._dispatch("message", message)
+        self._dispatch(parsed_message.message_type, parsed_message)
+
+    async def emit(self, message: Message) -> None:
+        """Отправляет сообщение в шину.
+
+        Args:
+            message (Message): Сообщение.
+        """
+        await self.connected_event.wait()
+        await self._ws.send(message.serialize())
+
+    async def wait_for_message(self, message_type: str, timeout: float = 3.0):
+        """Ожидает сообщение конкретного типа.
+
+        Arguments:
+            message_type (str): Тип ожидаемого сообщения.
+            timeout: время ожидания, сек.
+
+        Returns:
+            Полученное сообщение или None при истечении времени ожидания.
+        """
+        future = asyncio.get_running_loop().create_future()
+        return await self._wait_for(future, message_type, timeout)
+
+    async def wait_for_response(
+        self,
+        message: Message,
+        reply_type: str | None = None,
+        timeout: float = 3.0,
+    ):
+        """Отправляет сообщение и ждет ответа.
+
+        Arguments:
+            message (Message): Отправляемое сообщение.
+            reply_type (str): Ожидаемый тип ответного сообщения.
+                              Defaults to "<message.message_type>.response".
+            timeout: Время ожидания, сек.
+
+        Returns:
+            Полученное сообщение или None при истечении времени ожидания.
+        """
+        message_type = reply_type or message.message_type + ".response"
+        future = asyncio.get_running_loop().create_future()
+        waiter = asyncio.ensure_future(
+            self._wait_for(future, message_type, timeout)
+        )
+        await self.emit(message)
+        return await waiter
+
+    async def _wait_for(self, future, message_type: str, timeout: float):
+        def handler(message):
+            if not future.done():
+                future.set_result(message)
+
+        self.once(message_type, handler)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.remove(message_type, handler)
+            return None
+
+    async def run_forever(self) -> None:
+        """Обслуживает соединение, переподключаясь при ошибках."""
+        while not self._closed:
+            try:
+                async with websockets.connect(self.url) as ws:
+                    self._ws = ws
+                    LOG.info("Подключен")
+                    self.connected_event.set()
+                    self._connected_since = time.monotonic()
+                    self._dispatch("open")
+                    async for frame in ws:
+                        try:
+                            self.on_message(frame)
+                        except Exception as error:
+                            # Некорректный фрейм не должен разрывать
+                            # соединение.
+                            LOG.exception("=== %s ===", repr(error))
+                            self._dispatch("error", error)
+            except (OSError, websockets.WebSocketException) as error:
+                if isinstance(error, ConnectionRefusedError):
+                    LOG.warning(
+                        "Соединение отклонено. Платформенная шина запущена?"
+                    )
+                else:
+                    LOG.warning("=== %s ===", repr(error))
+                self._dispatch("error", error)
+            finally:
+                self._ws = None
+                self.connected_event.clear()
+                self._dispatch("close")
+
+            if self._closed:
+                break
+            delay = self._next_retry_delay()
+            LOG.warning(
+                "Попытка соединения с шиной будет повторена через "
+                f"{delay:.1f} секунд.",
+            )
+            await asyncio.sleep(delay)
+            self._dispatch("reconnecting")
+
+    async def close(self) -> None:
+        """Закрывает соединение с сокетом."""
+        self._closed = True
+        if self._ws is not None:
+            await self._ws.close()
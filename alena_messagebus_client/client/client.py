@@ -3,32 +3,139 @@
 сообщения и автоматически выполняющий сериализацию/десериализацию сообщений.
 """
 from collections import namedtuple
-import json
+from functools import lru_cache, partial
 import logging
+import random
+import socket
+import sys
 import time
 import traceback
+from queue import Empty, SimpleQueue
 from threading import Event, Thread
+from typing import Callable
 from uuid import uuid4
+from weakref import WeakKeyDictionary
 
 from pyee import ExecutorEventEmitter
 from websocket import (
+    ABNF,
     WebSocketApp,
     WebSocketConnectionClosedException,
     WebSocketException,
 )
 
-from alena_messagebus_client.message import Message, CollectionMessage
+from alena_messagebus_client.message import (
+    CollectionMessage,
+    Message,
+    swap_source_destination,
+)
 from alena_messagebus_client.util import create_echo_function
+from alena_messagebus_client.util.serialization import dumps
 
 from .collector import MessageCollector
+from .emitter import DirectEmitter
 from .waiter import MessageWaiter
 
 LOG = logging.getLogger(__name__)
 
 MessageBusClientConf = namedtuple(
-    "MessageBusClientConf", ["host", "port", "route", "ssl"]
+    "MessageBusClientConf",
+    ["host", "port", "route", "ssl", "tcp_nodelay", "tcp_cork"],
+    defaults=[True, True],
 )
 
+FLUSH_MODES = ("immediate", "coalesce")
+
+# Границы задержки переподключения, сек. Задержка сбрасывается, если
+# соединение продержалось дольше RETRY_RESET_AFTER.
+RETRY_MIN = 5
+RETRY_MAX = 60
+RETRY_RESET_AFTER = 30
+
+# TCP_CORK есть только в Linux, на macOS и Windows остается только NODELAY.
+_TCP_CORK = getattr(socket, "TCP_CORK", None)
+if not sys.platform.startswith("linux"):
+    _TCP_CORK = None
+
+
+# Подтверждение обработчика сборщика ответов. Форма сообщения фиксирована,
+# поэтому оно собирается по шаблону, минуя `Message.reply` и `emit`.
+_ACK_TEMPLATE = (
+    b'{"type":%b,"payload":{"query":%b,"handler":"%b","timeout":%b},'
+    b'"context":%b}'
+)
+
+
+def _fallback_serialize(message) -> bytes:
+    """Сериализует объект без метода `serialize`.
+
+    Использует только канонические атрибуты сообщения `message_type`,
+    `payload` и `context`, поэтому работает и для объектов со
+    `__slots__`, у которых нет `__dict__`.
+    """
+    return dumps(
+        {
+            "type": message.message_type,
+            "payload": getattr(message, "payload", None) or {},
+            "context": getattr(message, "context", None) or {},
+        }
+    )
+
+
+# Сериализатор, выбранный для каждого класса сообщений при первой отправке.
+_SERIALIZERS = WeakKeyDictionary()
+
+
+def _serializer_for(cls) -> callable:
+    serializer = _SERIALIZERS.get(cls)
+    if serializer is None:
+        if getattr(cls, "serialize", None) is Message.serialize:
+            # Готовые байты отправляются без лишнего decode/encode.
+            serializer = cls.frame
+        else:
+            serializer = getattr(cls, "serialize", None) or _fallback_serialize
+        _SERIALIZERS[cls] = serializer
+    return serializer
+
+
+def _write_frames(ws, frames: list, cork: Callable | None = None) -> None:
+    """Записывает несколько текстовых фреймов в сокет одним вызовом.
+
+    Фреймы формируются так же, как в `WebSocket.send_frame`, но
+    склеиваются в один буфер, поэтому пачка сообщений уходит в ядро
+    за один системный вызов.
+
+    Args:
+        ws (WebSocket): подключенный веб-сокет.
+        frames (list): сериализованные сообщения (str или bytes).
+        cork (callable): включает (1) и выключает (0) `TCP_CORK`.
+            Вызывается, только если буфер не ушел за один вызов.
+    """
+    if ws is None or not ws.connected:
+        raise WebSocketConnectionClosedException("Соединение закрыто")
+    chunks = []
+    for payload in frames:
+        frame = ABNF.create_frame(payload, ABNF.OPCODE_TEXT)
+        if ws.get_mask_key:
+            frame.get_mask_key = ws.get_mask_key
+        chunks.append(frame.format())
+    data = b"".join(chunks)
+    with ws.lock:
+        bytes_sent = ws._send(data)
+        data = data[bytes_sent:]
+        if not data:
+            return
+        # Остаток уходит несколькими вызовами, пусть ядро их склеит.
+        if cork is not None:
+            cork(1)
+        try:
+            while data:
+                bytes_sent = ws._send(data)
+                data = data[bytes_sent:]
+        finally:
+            if cork is not None:
+                cork(0)
+
 
 class MessageBusClient:
     """Клиент платформы виртуального ассистента.
@@ -36,6 +143,12 @@ class MessageBusClient:
     Подключается к платформенной шине и интегрируется с системой.
     Работает подобно `pyee` `EventEmitter`, но добавляет сервисы
     для разработчика.
+
+    По умолчанию обработчики выполняются в пуле потоков `pyee`. С
+    `direct_dispatch=True` они вызываются напрямую в потоке веб-сокета
+    (`DirectEmitter`), без передачи в пул. Такие обработчики не должны
+    блокироваться: пока они работают, сокет не читается, и, например,
+    вложенный `wait_for_response` не дождется ответа.
     """
 
     def __init__(
@@ -44,19 +157,61 @@ class MessageBusClient:
         port: int = 8181,
         route: str = "/core",
         ssl: bool = False,
-        emitter: ExecutorEventEmitter | None = None,
+        emitter: ExecutorEventEmitter | DirectEmitter | None = None,
+        direct_dispatch: bool = False,
+        flush_mode: str = "immediate",
+        flush_batch: int = 128,
+        tcp_nodelay: bool = True,
+        tcp_cork: bool = True,
+        fast_ack: bool = True,
     ):
-        self.config = MessageBusClientConf(host, port, route, ssl)
-        self.emitter = emitter or ExecutorEventEmitter()
+        if flush_mode not in FLUSH_MODES:
+            raise ValueError(
+                f"flush_mode должен быть одним из {FLUSH_MODES}, "
+                f"получено {flush_mode!r}"
+            )
+        if flush_batch < 1:
+            raise ValueError(
+                "flush_batch должен быть не меньше 1, "
+                f"получено {flush_batch!r}"
+            )
+        self.config = MessageBusClientConf(
+            host, port, route, ssl, tcp_nodelay, tcp_cork
+        )
+        if emitter is None:
+            if direct_dispatch:
+                emitter = DirectEmitter()
+            else:
+                emitter = ExecutorEventEmitter()
+        self.emitter = emitter
         self.client = self.create_client()
-        self.retry = 5
+        self.retry = RETRY_MIN
+        self.connect_attempts = 0
+        self._connected_since = None
+        self._connected = False
+        self._closed = False
+        # Выставляется в close() и прерывает ожидание переподключения.
+        self._close_event = Event()
+        self._reconnect_requested = False
         self.connected_event = Event()
         self.started_running = False
         self.wrapped_funcs = {}
+        self._has_raw_listener = False
+        self._update_raw_listener()
+        self._fast_ack = fast_ack
+
+        self.flush_mode = flush_mode
+        self._flush_batch = flush_batch
+        self._send_q = SimpleQueue()
+        self._writer = None
 
     @staticmethod
+    @lru_cache(maxsize=32)
     def build_url(host: str, port: int, route: str, ssl: bool) -> str:
-        """Формирует url для веб-сокета."""
+        """Формирует url для веб-сокета.
+
+        Результат кэшируется, аргументы должны быть хэшируемыми.
+        """
         return "{scheme}://{host}:{port}{route}".format(
             scheme="wss" if ssl else "ws",
             host=host,
@@ -83,16 +238,24 @@ class MessageBusClient:
     def on_open(self, *args) -> None:
         """Обрабатывает событие "open" от сокета."""
         LOG.info("Подключен")
+        if self.config.tcp_nodelay:
+            self._setsockopt(socket.TCP_NODELAY, 1)
+        self._connected_since = time.monotonic()
+        self._connected = True
         self.connected_event.set()
         self.emitter.emit("open")
-        self.retry = 5
 
     def on_close(self, *args) -> None:
         """Обрабатывает событие "close" от вебсокета."""
+        self._connected = False
         self.emitter.emit("close")
 
     def on_error(self, *args) -> None:
-        """При ошибке пробует подключиться заново."""
+        """Обрабатывает ошибку сокета.
+
+        Закрывает текущее соединение и помечает, что требуется
+        переподключение. Само переподключение выполняет `run_forever`.
+        """
         if len(args) == 1:
             error = args[0]
         else:
@@ -114,23 +277,52 @@ class MessageBusClient:
             LOG.error(
                 f"Exception при закрытии сокета на {self.client.url}: {e}"
             )
+        self._reconnect_requested = True
 
+    def _handle_reconnect(self) -> None:
+        """Выжидает задержку и создает новое соединение."""
+        self._reconnect_requested = False
+        delay = self._next_retry_delay()
         LOG.warning(
             "Попытка соединения с шиной будет повторена через "
-            f"{self.retry:.1f} секунд.",
+            f"{delay:.1f} секунд.",
         )
-        time.sleep(self.retry)
-        self.retry = min(self.retry * 2, 60)
-        try:
-            self.emitter.emit("reconnecting")
-            self.client = self.create_client()
-            self.run_forever()
-        except WebSocketException:
-            pass
+        if self._close_event.wait(delay) or self._closed:
+            return
+        self.emitter.emit("reconnecting")
+        self.client = self.create_client()
+
+    def _next_retry_delay(self) -> float:
+        """Вычисляет задержку перед переподключением.
+
+        Задержка растет только при неудачных попытках подключения. Ошибка
+        на уже установленном соединении ее не увеличивает, а после
+        стабильной работы дольше `RETRY_RESET_AFTER` секунд задержка
+        сбрасывается. К задержке добавляется разброс ±25%, чтобы клиенты
+        не переподключались к перезапущенной шине одновременно.
+
+        Returns:
+            float: задержка, сек.
+        """
+        if self._connected_since is not None:
+            uptime = time.monotonic() - self._connected_since
+            self._connected_since = None
+            if uptime > RETRY_RESET_AFTER:
+                self.retry = RETRY_MIN
+                self.connect_attempts = 0
+            return self.retry * random.uniform(0.75, 1.25)
+
+        self.connect_attempts += 1
+        delay = self.retry * random.uniform(0.75, 1.25)
+        self.retry = min(self.retry * 2, RETRY_MAX)
+        return delay
 
     def on_message(self, *args):
         """Обрабатывает входящее сообщение.
 
+        Событие "message" с исходной строкой отправляется, только если на
+        него подписан хотя бы один обработчик через `on`/`once`.
+
         Args:
             message (str): сериализованное сообщение платформы.
         """
@@ -139,7 +331,8 @@ class MessageBusClient:
         else:
             message = args[1]
         parsed_message = Message.deserialize(message)
-        self.emitter.emit("message", message)
+        if self._has_raw_listener:
+            self.emitter.emit("message", message)
         self.emitter.emit(parsed_message.message_type, parsed_message)
 
     def emit(self, message: Message) -> None:
@@ -148,9 +341,70 @@ class MessageBusClient:
         Отправляет сообщение в локальный процесс с помощью event emitter и в
         вебсокет для других процессов (сервисов).
 
+        В режиме `flush_mode="coalesce"` сообщение помещается в очередь
+        потока записи, который отправляет накопившиеся сообщения пачками.
+
         Args:
             message (Message): Сообщение.
         """
+        if not self._connected:
+            self._wait_for_connection()
+        self._send(self._serialize(message), message.message_type)
+
+    def emit_many(self, messages: list) -> None:
+        """Отправляет несколько сообщений в шину.
+
+        Сообщения сериализуются заранее и записываются в сокет пачками
+        по `flush_batch` штук, по одному системному вызову на пачку.
+
+        Args:
+            messages (list): Сообщения.
+        """
+        if not self._connected:
+            self._wait_for_connection()
+        frames = [self._serialize(message) for message in messages]
+        if self.flush_mode == "coalesce":
+            for frame in frames:
+                self._send_q.put(frame)
+            return
+
+        for i in range(0, len(frames), self._flush_batch):
+            self._send_frames(frames[i : i + self._flush_batch])
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Дожидается отправки сообщений, поставленных в очередь ранее.
+
+        Args:
+            timeout (float): время ожидания, сек.
+
+        Returns:
+            bool: True, если очередь отправлена.
+        """
+        if self._writer is None or not self._writer.is_alive():
+            return self._send_q.empty()
+        done = Event()
+        self._send_q.put(done)
+        return done.wait(timeout)
+
+    def _send(self, frame: str | bytes, message_type: str) -> None:
+        if self.flush_mode == "coalesce":
+            self._send_q.put(frame)
+            return
+
+        try:
+            self.client.send(frame)
+        except WebSocketConnectionClosedException:
+            LOG.warning(
+                f"Не удалось отправить {message_type} сообщение, "
+                "потому что соединение закрыто"
+            )
+
+    def _wait_for_connection(self) -> None:
+        """Ожидает подключения к шине.
+
+        Вызывается, только пока не выставлен флаг `_connected`, поэтому на
+        подключенном клиенте отправка не обращается к `connected_event`.
+        """
         if not self.connected_event.wait(10):
             if not self.started_running:
                 raise ValueError(
@@ -158,18 +412,78 @@ class MessageBusClient:
                 )
             self.connected_event.wait()
 
+    @staticmethod
+    def _serialize(message: Message) -> str | bytes:
+        return _serializer_for(type(message))(message)
+
+    def _start_writer(self) -> None:
+        if self._writer is not None and self._writer.is_alive():
+            return
+        self._writer = Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    def _writer_loop(self) -> None:
+        """Поток записи в сокет для режима `coalesce`.
+
+        Забирает из очереди все накопившиеся фреймы (не более
+        `flush_batch` за раз) и отправляет их одной пачкой. Пока очередь
+        пуста, поток ждет, поэтому одиночное сообщение уходит сразу.
+        Элемент `None` останавливает поток, `Event` выставляется после
+        отправки всех предшествующих фреймов.
+        """
+        running = True
+        while running:
+            items = [self._send_q.get()]
+            while len(items) < self._flush_batch:
+                try:
+                    items.append(self._send_q.get_nowait())
+                except Empty:
+                    break
+
+            frames = []
+            for item in items:
+                if item is None:
+                    running = False
+                elif isinstance(item, Event):
+                    if frames:
+                        self._send_frames(frames)
+                        frames = []
+                    item.set()
+                else:
+                    frames.append(item)
+            if frames:
+                self._send_frames(frames)
+
+    def _send_frames(self, frames: list) -> None:
+        cork = None
+        if self.config.tcp_cork and _TCP_CORK is not None:
+            cork = partial(self._setsockopt, _TCP_CORK)
+        # Поток записи не должен завершаться из-за ошибки отправки, иначе
+        # очередь перестанет разбираться.
         try:
-            if hasattr(message, "serialize"):
-                self.client.send(message.serialize())
-            else:
-                self.client.send(
-                    json.dumps(message.__dict__, ensure_ascii=False)
-                )
-        except WebSocketConnectionClosedException:
+            _write_frames(self.client.sock, frames, cork)
+        except (WebSocketConnectionClosedException, OSError):
             LOG.warning(
-                f"Не удалось отправить {message.message_type} сообщение, "
+                f"Не удалось отправить {len(frames)} сообщений, "
                 "потому что соединение закрыто"
             )
+        except WebSocketException as e:
+            LOG.warning(
+                f"Не удалось отправить {len(frames)} сообщений: {e!r}"
+            )
+        except Exception:
+            LOG.exception(f"Ошибка при отправке {len(frames)} сообщений")
+
+    def _setsockopt(self, option: int, value: int) -> None:
+        """Устанавливает опцию TCP на сокете текущего соединения."""
+        ws = self.client.sock
+        raw_sock = getattr(ws, "sock", None)
+        if raw_sock is None:
+            return
+        try:
+            raw_sock.setsockopt(socket.IPPROTO_TCP, option, value)
+        except OSError as e:
+            LOG.debug("Не удалось установить опцию сокета %s: %s", option, e)
 
     def collect_responses(
         self,
@@ -205,21 +519,44 @@ class MessageBusClient:
 
         def wrapper(msg: Message):
             collect_id = msg.context["__collect_id__"]
-            handler_id = str(uuid4())
-            acknowledge = msg.reply(
-                msg.message_type + ".handling",
-                data={
-                    "query": collect_id,
-                    "handler": handler_id,
-                    "timeout": timeout,
-                },
-            )
-            self.emit(acknowledge)
+            handler_id = uuid4().hex
+            if self._fast_ack and type(msg).reply is Message.reply:
+                self._acknowledge(msg, collect_id, handler_id, timeout)
+            else:
+                acknowledge = msg.reply(
+                    msg.message_type + ".handling",
+                    payload={
+                        "query": collect_id,
+                        "handler": handler_id,
+                        "timeout": timeout,
+                    },
+                )
+                self.emit(acknowledge)
             func(CollectionMessage.from_message(msg, handler_id, collect_id))
 
         self.wrapped_funcs[func] = wrapper
         self.on(event_name, wrapper)
 
+    def _acknowledge(
+        self, msg: Message, collect_id: str, handler_id: str, timeout: float
+    ) -> None:
+        """Отправляет подтверждение `.handling`, собранное по шаблону.
+
+        Результат совпадает с `msg.reply(...)` с той же полезной нагрузкой.
+        """
+        message_type = msg.message_type + ".handling"
+        context = swap_source_destination(dict(msg.context))
+        frame = _ACK_TEMPLATE % (
+            dumps(message_type),
+            dumps(collect_id),
+            handler_id.encode(),
+            dumps(timeout),
+            dumps(context),
+        )
+        if not self._connected:
+            self._wait_for_connection()
+        self._send(frame, message_type)
+
     def wait_for_message(self, message_type: str, timeout: float = 3.0):
         """Ожидает сообщение конкретного типа.
 
@@ -231,7 +568,8 @@ class MessageBusClient:
             Полученное сообщение или None при истечении времени ожидания.
         """
 
-        return MessageWaiter(self, message_type).wait(timeout)
+        with MessageWaiter.acquire(self, message_type) as waiter:
+            return waiter.wait(timeout)
 
     def wait_for_response(
         self,
@@ -251,9 +589,9 @@ class MessageBusClient:
             Полученное сообщение или None при истечении времени ожидания.
         """
         message_type = reply_type or message.message_type + ".response"
-        waiter = MessageWaiter(self, message_type)
-        self.emit(message)
-        return waiter.wait(timeout)
+        with MessageWaiter.acquire(self, message_type) as waiter:
+            self.emit(message)
+            return waiter.wait(timeout)
 
     def on(self, event_name: str, func: callable):
         """Регистрирует колбэк с `event emitter`.
@@ -263,6 +601,8 @@ class MessageBusClient:
             func (callable): callback.
         """
         self.emitter.on(event_name, func)
+        if event_name == "message":
+            self._has_raw_listener = True
 
     def once(self, event_name: str, func: callable):
         """Регистрирует колбэк с event emitter для разового вызова.
@@ -272,6 +612,8 @@ class MessageBusClient:
             func (callable): callback
         """
         self.emitter.once(event_name, func)
+        if event_name == "message":
+            self._has_raw_listener = True
 
     def remove(self, event_name: str, func: callable):
         """Удаляет зарегистрированное сообщение.
@@ -284,6 +626,17 @@ class MessageBusClient:
             self._remove_wrapped(event_name, func)
         else:
             self._remove_normal(event_name, func)
+        if event_name == "message":
+            self._update_raw_listener()
+
+    def _update_raw_listener(self):
+        """Обновляет признак наличия обработчиков события "message"."""
+        events = getattr(self.emitter, "_events", None)
+        if isinstance(events, dict):
+            self._has_raw_listener = bool(events.get("message"))
+        else:
+            # Неизвестный эмиттер: событие отправляется всегда.
+            self._has_raw_listener = True
 
     def _remove_wrapped(self, event_name: str, external_func: callable):
         wrapper = self.wrapped_funcs.pop(external_func)
@@ -298,20 +651,27 @@ class MessageBusClient:
             LOG.warning(
                 "Не удалось удалить " f"событие {event_name}: {str(func)}"
             )
-            for line in traceback.format_stack():
-                LOG.warning(line.strip())
+            if LOG.isEnabledFor(logging.DEBUG):
+                self._dump_emitter_state(event_name)
 
-            if event_name not in self.emitter._events:
-                LOG.debug("Не удалось найти '%s'", event_name)
-            LOG.warning("Существующие события: %s", repr(self.emitter._events))
-            for evt in self.emitter._events:
-                LOG.warning("   %s", repr(evt))
-                LOG.warning("       %s", repr(self.emitter._events[evt]))
-            if event_name in self.emitter._events:
-                LOG.debug("При удалении '%s'", event_name)
-            else:
-                LOG.debug("Не удалось найти '%s'", event_name)
-            LOG.warning("----- Завершение дампа -----")
+    def _dump_emitter_state(self, event_name: str):
+        """Выводит в лог стек вызова и зарегистрированные события.
+
+        Обход стека и событий дорогой, поэтому вызывается только при
+        включенном уровне DEBUG.
+        """
+        for line in traceback.format_stack():
+            LOG.debug(line.strip())
+
+        LOG.debug("Существующие события: %s", repr(self.emitter._events))
+        for evt in self.emitter._events:
+            LOG.debug("   %s", repr(evt))
+            LOG.debug("       %s", repr(self.emitter._events[evt]))
+        if event_name in self.emitter._events:
+            LOG.debug("При удалении '%s'", event_name)
+        else:
+            LOG.debug("Не удалось найти '%s'", event_name)
+        LOG.debug("----- Завершение дампа -----")
 
     def remove_all_listeners(self, event_name: str):
         """Удаляет всех прослушивателей event_name.
@@ -322,15 +682,38 @@ class MessageBusClient:
         if event_name is None:
             raise ValueError
         self.emitter.remove_all_listeners(event_name)
+        if event_name == "message":
+            self._update_raw_listener()
 
     def run_forever(self):
-        """Стартует обработку сокета."""
+        """Стартует обработку сокета.
+
+        После ошибки соединения переподключается в цикле, пока клиент не
+        будет закрыт через `close()`.
+        """
         self.started_running = True
-        self.client.run_forever()
+        self._closed = False
+        self._close_event.clear()
+        if self.flush_mode == "coalesce":
+            self._start_writer()
+        while not self._closed:
+            try:
+                errored = self.client.run_forever()
+            except WebSocketException:
+                errored = True
+            if not (errored or self._reconnect_requested):
+                break
+            self._handle_reconnect()
 
     def close(self):
         """Закрывает соединение с сокетом."""
+        self._closed = True
+        self._close_event.set()
+        if self._writer is not None and self._writer.is_alive():
+            self.flush(timeout=1)
+            self._send_q.put(None)
         self.client.close()
+        self._connected = False
         self.connected_event.clear()
 
     def run_in_thread(self):
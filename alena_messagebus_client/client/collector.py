@@ -1,5 +1,5 @@
-from queue import Queue
-from threading import Lock, Event
+from queue import Empty, Queue
+from threading import Condition, Event, Lock
 from uuid import uuid4
 import time
 
@@ -16,6 +16,8 @@ class MessageCollector:
         min_timeout (int/float): Минимальное время ожидания ответа.
         max_timeout (int/float): Максимальное время ожидания ответа.
         direct_return_func (callable): Опциональная функция для раннего ответа.
+            Вызывается для каждого ответа в потоке обработчика, поэтому
+            должна быть быстрой и без побочных эффектов.
     """
 
     def __init__(
@@ -26,12 +28,25 @@ class MessageCollector:
         self.min_timeout = min_timeout
         self.max_timeout = max_timeout
         self.direct_return_func = direct_return_func or (lambda msg: False)
-        self.collect_id = str(uuid4())
-        self.handlers = {}
-        self.responses = {}
+        self.collect_id = uuid4().hex
+        # Данные обработчиков хранятся в параллельных списках, индекс
+        # обработчика назначается при регистрации.
+        self._handler_index = {}
+        self._timeouts = []
+        self._responses = []
+        self._response_count = 0
+        self._max_timeout = 0.0
         self.all_collected = Event()
+        # Уведомляется при завершении сбора и при уменьшении наибольшего
+        # таймаута, чтобы ожидание не длилось до устаревшего срока.
+        self._changed = Condition(self.lock)
         self.message = message
-        self.message.context["__collect_id__"] = self.collect_id
+        # Контекст заменяется новым словарем: исходное сообщение могло
+        # быть уже сериализовано и закэшировать фрейм.
+        message.context = {
+            **message.context,
+            "__collect_id__": self.collect_id,
+        }
         self._start_time = 0
 
         self.on_response_callback = None
@@ -41,22 +56,47 @@ class MessageCollector:
         return self
 
     def __next__(self):
-        msg = Queue.get()
-        if msg is not None:
-            return msg
-        else:
+        msg = self.queue.get()
+        if msg is None:
             raise StopIteration
+        return msg
+
+    def poll(self, timeout=None):
+        """Возвращает очередной ответ, не дожидаясь завершения сбора.
+
+        Args:
+            timeout (int/float): время ожидания, сек. Если None, ответ
+                забирается только если он уже получен.
+
+        Returns:
+            Полученный ответ или None, если ответа нет или сбор завершен.
+        """
+        try:
+            if timeout is None:
+                return self.queue.get_nowait()
+            return self.queue.get(timeout=timeout)
+        except Empty:
+            return None
 
     def on_response(self, callback_func):
         self.on_response_callback = callback_func
 
+    def _add_handler(self, handler_id, timeout):
+        """Назначает обработчику индекс. Вызывается под `self.lock`."""
+        self._handler_index[handler_id] = len(self._timeouts)
+        self._timeouts.append(timeout)
+        self._responses.append(None)
+        if timeout > self._max_timeout:
+            self._max_timeout = timeout
+
     def _register_handler(self, msg):
-        handler_id = msg.data["handler"]
-        timeout = msg.data["timeout"]
+        if msg.payload["query"] != self.collect_id:
+            return
+        handler_id = msg.payload["handler"]
+        timeout = msg.payload["timeout"]
         with self.lock:
-            if msg.data["query"] == self.collect_id and handler_id not in self.handlers:
-                previous_timeout = self.handlers.get(handler_id, 0)
-                self.handlers[handler_id] = previous_timeout + timeout
+            if handler_id not in self._handler_index:
+                self._add_handler(handler_id, timeout)
 
     def _receive_response(self, msg):
         """Обработчик ответа.
@@ -64,41 +104,71 @@ class MessageCollector:
         Args:
             msg: Сообщение.
         """
-        with self.lock:
-            if msg.data["query"] == self.collect_id:
+        if msg.payload["query"] == self.collect_id:
+            handler_id = msg.payload["handler"]
+            # Под блокировкой выполняется только обновление счетчиков,
+            # проверка direct_return_func и сигнал выполняются вне ее.
+            with self.lock:
                 self.queue.put(msg)
-                self.responses[msg.data["handler"]] = msg
-                self.handlers[msg.data["handler"]] = 0  # Reset timeout
-                # If all registered handlers have responded with an answer
-                # or a VERY good answer has been found indicate end of wait.
-                all_collected = len(self.responses) == len(self.handlers)
-                if all_collected or self.direct_return_func(msg):
-                    self.queue.put(None)
+                if handler_id not in self._handler_index:
+                    self._add_handler(handler_id, 0)
+                idx = self._handler_index[handler_id]
+                if self._responses[idx] is None:
+                    self._response_count += 1
+                self._responses[idx] = msg
+                self._reset_timeout(idx)
+                all_collected = self._response_count == len(self._timeouts)
+            # If all registered handlers have responded with an answer
+            # or a VERY good answer has been found indicate end of wait.
+            if all_collected or self.direct_return_func(msg):
+                self.queue.put(None)
+                with self.lock:
                     self.all_collected.set()
+                    self._changed.notify_all()
 
         if self.on_response_callback:
             self.on_response_callback(msg)
 
+    def _reset_timeout(self, idx):
+        """Обнуляет таймаут ответившего обработчика.
+
+        Максимум пересчитывается, только если таймаут этого обработчика
+        был наибольшим. Вызывается под `self.lock`.
+        """
+        timeout = self._timeouts[idx]
+        self._timeouts[idx] = 0
+        if timeout and timeout >= self._max_timeout:
+            self._max_timeout = max(self._timeouts)
+            self._changed.notify_all()
+
     def _setup_collection_handlers(self):
         base_message_type = self.message.message_type
-        self.bus.on(base_message_type + ".handling", self._register_handler)
-        self.bus.on(base_message_type + ".response", self._receive_response)
+        self.message_bus.on(
+            base_message_type + ".handling", self._register_handler
+        )
+        self.message_bus.on(
+            base_message_type + ".response", self._receive_response
+        )
 
     def _teardown_collection_handlers(self):
         base_message_type = self.message.message_type
-        self.bus.remove(base_message_type + ".handling", self._register_handler)
-        self.bus.remove(base_message_type + ".response", self._receive_response)
+        self.message_bus.remove(
+            base_message_type + ".handling", self._register_handler
+        )
+        self.message_bus.remove(
+            base_message_type + ".response", self._receive_response
+        )
 
     def start(self):
         self._setup_collection_handlers()
-        self.bus.emit(self.message)
-        self.start_time = time.monotonic()
+        self.message_bus.emit(self.message)
+        self._start_time = time.monotonic()
 
         time.sleep(self.min_timeout)
 
     def collect(self):
         self.start()
-        if len(self.handlers) == 0:
+        if not self._timeouts:
             # No handlers has registered to answer the query
             result = []
         else:
@@ -112,21 +182,24 @@ class MessageCollector:
 
     def _wait_for_registered_handlers(self):
         with self.lock:
-            all_collected = len(self.responses) == len(self.handlers)
+            all_collected = self._response_count == len(self._timeouts)
             if not all_collected:
                 self.all_collected.clear()
 
-        time_waited = self.min_timeout
-        remaining_timeout = max(self.handlers.values()) - time_waited
-        while remaining_timeout > 0.0 and time_waited < self.max_timeout:
-            if self.all_collected.wait(timeout=0.1):
-                break
-
-            time_waited += 0.1
-            remaining_timeout = max(self.handlers.values()) - time_waited
+            # Срок пересчитывается после каждого уведомления: поздний
+            # обработчик может его увеличить, а ответ обработчика с
+            # наибольшим таймаутом - уменьшить.
+            while not all_collected and not self.all_collected.is_set():
+                deadline = self._start_time + min(
+                    self._max_timeout, self.max_timeout
+                )
+                remaining = deadline - time.monotonic()
+                if remaining <= 0.0:
+                    break
+                self._changed.wait(remaining)
 
         self.queue.put(None)
-        return [self.responses[key] for key in self.responses]
+        return [r for r in self._responses if r is not None]
 
     def shutdown(self):
         self._teardown_collection_handlers()
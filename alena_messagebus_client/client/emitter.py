@@ -0,0 +1,117 @@
+"""
+Диспетчер событий с прямым вызовом обработчиков.
+
+Повторяет ту часть интерфейса `pyee`, которой пользуется
+`MessageBusClient`, но вызывает обработчики сразу в потоке, принявшем
+сообщение, без передачи в пул потоков.
+"""
+import logging
+from threading import Lock
+from typing import Callable
+
+LOG = logging.getLogger(__name__)
+
+
+class DirectEmitter:
+    """Таблица обработчиков событий с прямым вызовом.
+
+    Структура `_events` совпадает с `pyee`: для каждого события хранится
+    словарь `исходная функция -> вызываемая функция`.
+
+    Обработчики выполняются в потоке веб-сокета, поэтому не должны
+    блокироваться в ожидании других сообщений шины (например, вызывать
+    `wait_for_response`). Используется клиентом только при
+    `MessageBusClient(direct_dispatch=True)`.
+    """
+
+    def __init__(self):
+        self._events = {}
+        self._lock = Lock()
+
+    def on(self, event: str, f: callable) -> callable:
+        """Регистрирует обработчик события.
+
+        Args:
+            event (str): событие.
+            f (callable): обработчик.
+        """
+        with self._lock:
+            self._events.setdefault(event, {})[f] = f
+        return f
+
+    def once(self, event: str, f: callable) -> callable:
+        """Регистрирует обработчик для разового вызова.
+
+        Args:
+            event (str): событие.
+            f (callable): обработчик.
+        """
+
+        def wrapper(*args, **kwargs):
+            if self._pop(event, f) is None:
+                # Обработчик уже вызван из другого потока.
+                return None
+            return f(*args, **kwargs)
+
+        with self._lock:
+            self._events.setdefault(event, {})[f] = wrapper
+        return f
+
+    def emit(self, event: str, *args, **kwargs) -> bool:
+        """Вызывает обработчики события.
+
+        Исключения обработчиков записываются в лог и не прерывают
+        обработку остальных.
+
+        Args:
+            event (str): событие.
+
+        Returns:
+            bool: были ли у события обработчики.
+        """
+        handlers = self._events.get(event)
+        if not handlers:
+            return False
+        with self._lock:
+            handlers = tuple(handlers.values())
+        for handler in handlers:
+            try:
+                handler(*args, **kwargs)
+            except Exception:
+                LOG.exception("Ошибка в обработчике события '%s'", event)
+        return True
+
+    def remove_listener(self, event: str, f: callable) -> None:
+        """Удаляет обработчик события.
+
+        Args:
+            event (str): событие.
+            f (callable): обработчик.
+
+        Raises:
+            ValueError: обработчик не зарегистрирован.
+        """
+        if self._pop(event, f) is None:
+            raise ValueError(f"Обработчик {f!r} не найден для '{event}'")
+
+    def remove_all_listeners(self, event: str | None = None) -> None:
+        """Удаляет все обработчики события или все обработчики вообще.
+
+        Args:
+            event (str): событие.
+        """
+        with self._lock:
+            if event is None:
+                self._events = {}
+            else:
+                self._events.pop(event, None)
+
+    def _pop(self, event: str, f: callable) -> Callable | None:
+        with self._lock:
+            handlers = self._events.get(event)
+            if handlers is None:
+                return None
+            handler = handlers.pop(f, None)
+            if not handlers:
+                del self._events[event]
+            return handler
@@ -1,25 +1,85 @@
-from threading import Event
+from threading import Lock
+
+# Пул переиспользуемых объектов ожидания и его максимальный размер.
+_POOL_SIZE = 64
+_waiter_pool = []
+_pool_lock = Lock()
 
 
 class MessageWaiter:
     """Механизм ожидания одного сообщения.
 
+    Вместо `threading.Event` используется захваченный `Lock`, который
+    освобождается обработчиком: так не создаются `Condition` и `RLock`
+    на каждое ожидание.
+
+    Для частых запросов объект лучше получать через `acquire()` и
+    возвращать через `release()` (или использовать как контекстный
+    менеджер), тогда объекты переиспользуются.
+
     Arguments:
         message_bus: Шина, от которой ожидаются сообщения.
         message_type: Тип ожидаемого сообщения.
     """
 
     def __init__(self, message_bus, message_type: str):
+        self._lock = Lock()
+        self._lock.acquire()
+        self._setup(message_bus, message_type)
+
+    def _setup(self, message_bus, message_type: str):
         self.message_bus = message_bus
         self.message_type = message_type
         self.received_msg = None
-        self.response_event = Event()
+        self._received = False
+        self._registered = True
         self.message_bus.once(message_type, self._handler)
 
+    @classmethod
+    def acquire(cls, message_bus, message_type: str):
+        """Возвращает объект ожидания из пула или создает новый.
+
+        Arguments:
+            message_bus: Шина, от которой ожидаются сообщения.
+            message_type: Тип ожидаемого сообщения.
+        """
+        waiter = None
+        if cls is MessageWaiter:
+            with _pool_lock:
+                if _waiter_pool:
+                    waiter = _waiter_pool.pop()
+        if waiter is None:
+            return cls(message_bus, message_type)
+        waiter._setup(message_bus, message_type)
+        return waiter
+
+    def release(self):
+        """Возвращает объект в пул.
+
+        В пул попадают только объекты, получившие сообщение: после
+        таймаута обработчик может сработать позже и испортить состояние
+        объекта, уже выданного другому вызывающему.
+        """
+        if type(self) is not MessageWaiter or not self._received:
+            return
+        self.received_msg = None
+        self.message_bus = None
+        with _pool_lock:
+            if len(_waiter_pool) < _POOL_SIZE:
+                _waiter_pool.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
     def _handler(self, message):
         """Обработчик полученного сообщения"""
+        # Обработчик `once` снимается шиной при вызове.
+        self._registered = False
         self.received_msg = message
-        self.response_event.set()
+        self._lock.release()
 
     def wait(self, timeout: float = 3.0):
         """Ожидает сообщение.
@@ -30,9 +90,17 @@ class MessageWaiter:
         Returns:
             Message or None
         """
-        self.response_event.wait(timeout)
-        if not self.response_event.is_set():
-            # Очистка
+        if self._received:
+            return self.received_msg
+        # После успешного ожидания блокировка снова захвачена, и объект
+        # готов к повторному использованию.
+        # Как и у Event.wait, неположительный таймаут не блокирует.
+        self._received = self._lock.acquire(
+            timeout=-1 if timeout is None else max(timeout, 0)
+        )
+        if not self._received and self._registered:
+            # Очистка. Обработчик мог сработать сразу после таймаута.
+            self._registered = False
             try:
                 self.message_bus.remove(self.message_type, self._handler)
             except (ValueError, KeyError):
@@ -1,9 +1,8 @@
 """Функции для обработки конфирураций."""
 
 
-import json
-
 from .client import MessageBusClient
+from .util.serialization import loads
 
 
 def client_from_config(
@@ -32,7 +31,7 @@ def client_from_config(
     Returns:
         MessageBusClient инстанс на основе настроек.
     """
-    with open(file_path) as f:
-        conf = json.load(f)
+    with open(file_path, "rb") as f:
+        conf = loads(f.read())
 
     return MessageBusClient(**conf[subconf])
@@ -5,11 +5,11 @@
 а также методы для сериализации / десериализации сообщения при его передаче.
 
 """
-import inspect
-import json
-from copy import deepcopy
+import sys
 from typing_extensions import Self
 
+from alena_messagebus_client.util.serialization import dumps, loads
+
 
 class Message:
     """Содержит данные, пересылаемые в платформенной шине между сервисами.
@@ -20,14 +20,25 @@ class Message:
       context (dict): данные, не входящие в полезную нагрузку, например,
       информация об отправителе, получателе, предметной области и др.
 
+    Сериализованный фрейм кэшируется вместе с объектами, из которых он
+    получен, и пересчитывается, если атрибуту `message_type`, `payload`
+    или `context` присвоен другой объект. Изменение словарей "на месте"
+    кэш не сбрасывает, поэтому после сериализации сообщение следует
+    считать неизменяемым.
+
+    Атрибуты хранятся в `__slots__`, произвольные атрибуты экземпляру
+    не назначаются.
     """
 
+    __slots__ = ("message_type", "payload", "context", "_cached_frame")
+
     def __init__(
         self, message_type: str, payload: dict = None, context: dict = None
     ) -> None:
         self.message_type = message_type
-        self.payload = payload or {}
-        self.context = context or {}
+        self.payload = {} if payload is None else payload
+        self.context = {} if context is None else context
+        self._cached_frame = None
 
     def serialize(self) -> str:
         """Сериализует сообщение.
@@ -38,28 +49,52 @@ class Message:
         Returns:
             str: сообщение в формате json.
         """
-        return json.dumps(
+        return self.frame().decode()
+
+    def frame(self) -> bytes:
+        """Сериализует сообщение в байты для отправки через веб-сокет.
+
+        Повторный вызов возвращает сохраненный результат, пока атрибутам
+        сообщения не присвоены другие объекты. Ключи словарей, не
+        являющиеся строками, преобразуются в строки, как в стандартном
+        `json`.
+
+        Returns:
+            bytes: сообщение в формате json в кодировке utf-8.
+        """
+        cached = self._cached_frame
+        if (
+            cached is not None
+            and cached[0] is self.message_type
+            and cached[1] is self.payload
+            and cached[2] is self.context
+        ):
+            return cached[3]
+        frame = dumps(
             {
                 "type": self.message_type,
                 "payload": self.payload,
                 "context": self.context,
-            },
-            ensure_ascii=False,
+            }
         )
+        self._cached_frame = (
+            self.message_type, self.payload, self.context, frame
+        )
+        return frame
 
     @staticmethod
-    def deserialize(value: str) -> Self:
+    def deserialize(value: str | bytes) -> Self:
         """Формирует объект `Message` из строки.
 
         Предназначен для создания объекта из строки, полученной из веб-сокета.
 
         Args:
-            value(str): json-строка.
+            value(str | bytes): json-строка.
 
         Returns:
             Message: объект `Message`
         """
-        obj = json.loads(value)
+        obj = loads(value)
         return Message(
             obj.get("type") or "",
             obj.get("payload") or {},
@@ -76,7 +111,6 @@ class Message:
         Returns:
             Message: Новый объект `Message`
         """
-        payload = payload or {}
         return Message(message_type, payload, context=self.context)
 
     def reply(
@@ -93,18 +127,11 @@ class Message:
             Message: Объект `Message` - ответ на сообщение.
         """
 
-        payload = deepcopy(payload) or {}
-        context = context or {}
-
-        new_context = deepcopy(self.context)
-        for key in context:
-            new_context[key] = context[key]
+        payload = _copy_json(payload) if payload else {}
+        new_context = _merge_context(self.context, context, deep=True)
         if "destination" in payload:
             new_context["destination"] = payload["destination"]
-        if "source" in new_context and "destination" in new_context:
-            s = new_context["destination"]
-            new_context["destination"] = new_context["source"]
-            new_context["source"] = s
+        swap_source_destination(new_context)
         return Message(message_type, payload, context=new_context)
 
     def response(
@@ -115,17 +142,65 @@ class Message:
     def publish(
         self, message_type: str, payload: dict, context: dict = None
     ) -> Self:
-        context = context or {}
-        new_context = self.context.copy()
-        for key in context:
-            new_context[key] = context[key]
-
-        if "target" in new_context:
-            del new_context["target"]
+        new_context = _merge_context(self.context, context)
+        new_context.pop("target", None)
 
         return Message(message_type, payload, context=new_context)
 
 
+def _copy_json(value):
+    """Копирует json-совместимую структуру.
+
+    Копируются только вложенные словари и списки, остальные значения
+    переносятся как есть. В отличие от `deepcopy` не ведет таблицу уже
+    скопированных объектов, поэтому структура не должна содержать циклов.
+    """
+    if isinstance(value, dict):
+        return {k: _copy_json(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(v) for v in value]
+    return value
+
+
+def _merge_context(
+    base: dict, extra: dict | None = None, deep: bool = False
+) -> dict:
+    """Создает новый контекст из `base`, дополненный ключами `extra`.
+
+    Args:
+        base (dict): исходный контекст.
+        extra (dict): ключи, заменяющие ключи исходного контекста.
+        deep (bool): копировать вложенные словари и списки `base`.
+
+    Returns:
+        dict: новый контекст.
+    """
+    if deep:
+        merged = _copy_json(base)
+        if extra:
+            merged.update(extra)
+        return merged
+    if extra:
+        return {**base, **extra}
+    return {**base}
+
+
+def swap_source_destination(context: dict) -> dict:
+    """Меняет местами отправителя и получателя в контексте ответа.
+
+    Args:
+        context (dict): изменяемый контекст.
+
+    Returns:
+        dict: тот же контекст.
+    """
+    if "source" in context and "destination" in context:
+        s = context["destination"]
+        context["destination"] = context["source"]
+        context["source"] = s
+    return context
+
+
 def dig_for_message(max_records: int = 10) -> Message | None:
     """
     Рассматривает стек сообщений. В текущем стеке ищет сообщение.
@@ -136,20 +211,28 @@ def dig_for_message(max_records: int = 10) -> Message | None:
     Returns:
         Message, если найдена в аргументах, иначе None
     """
-    stack = inspect.stack()[1:]  # на первом месте будет сама эта функция
-    stack = stack if len(stack) <= max_records else stack[:max_records]
-    for record in stack:
-        args = inspect.getargvalues(record.frame)
-        if args.args:
-            for arg in args.args:
-                if isinstance(args.locals[arg], Message):
-                    return args.locals[arg]
+    # Кадры просматриваются напрямую: inspect.stack() читает исходники
+    # всех кадров стека.
+    frame = sys._getframe(1)  # пропускаем саму эту функцию
+    for _ in range(max_records):
+        if frame is None:
+            break
+        code = frame.f_code
+        local_vars = frame.f_locals
+        nargs = code.co_argcount + code.co_kwonlyargcount
+        for arg in code.co_varnames[:nargs]:
+            value = local_vars.get(arg)
+            if isinstance(value, Message):
+                return value
+        frame = frame.f_back
     return None
 
 
 class CollectionMessage(Message):
     """Расширение класса сообщение с обработчиком сборщиков."""
 
+    __slots__ = ("handler_id", "query_id")
+
     def __init__(
         self, message_type, handler_id, query_id, payload=None, context=None
     ):
@@ -189,7 +272,8 @@ class CollectionMessage(Message):
         Returns:
             Message
         """
-        payload = payload or {}
+        if payload is None:
+            payload = {}
         payload["query"] = self.query_id
         payload["handler"] = self.handler_id
         payload["succeeded"] = True
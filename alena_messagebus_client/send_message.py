@@ -4,12 +4,51 @@ python -c "from alena_messagebus_client.send_message import send; \
 send('speak', {'utterance': 'hello'})"
 
 """
-from websocket import create_connection
+import atexit
+
+from websocket import (
+    WebSocket,
+    WebSocketConnectionClosedException,
+    create_connection,
+)
 from .client import MessageBusClient
+from .client.client import _serializer_for, _write_frames
 from .message import Message
 
+# Открытые соединения для повторного использования, по url.
+_conn_cache: dict[str, WebSocket] = {}
+
+
+def _build_url(config: dict) -> str:
+    return MessageBusClient.build_url(
+        config.get("host"),
+        config.get("port"),
+        config.get("route"),
+        config.get("ssl"),
+    )
+
+
+def _get_connection(url: str) -> WebSocket:
+    """Возвращает сохраненное соединение или открывает новое."""
+    ws = _conn_cache.get(url)
+    if ws is None or not ws.connected:
+        ws = _conn_cache[url] = create_connection(url)
+    return ws
+
+
+def _close_all() -> None:
+    """Закрывает сохраненные соединения."""
+    while _conn_cache:
+        _, ws = _conn_cache.popitem()
+        ws.close()
+
+
+atexit.register(_close_all)
+
 
-def send(message: str, payload: dict = None, config=None) -> None:
+def send(
+    message: str, payload: dict = None, config=None, *, reuse: bool = False
+) -> None:
     """Отправляет одно сообщение в платформу через веб-сокет.
 
     Args:
@@ -18,18 +57,49 @@ def send(message: str, payload: dict = None, config=None) -> None:
             По умолчанию None.
         config (_type_, optional): конфиг.
             По умолчанию None.
+        reuse (bool, optional): не закрывать соединение после отправки,
+            а использовать его при следующих вызовах с тем же адресом.
+            Соединения закрываются при завершении процесса.
+            По умолчанию False.
     """
     payload = payload or {}
     config = config or {}
 
-    url = MessageBusClient.build_url(
-        config.get("host"),
-        config.get("port"),
-        config.get("route"),
-        config.get("ssl"),
-    )
+    url = _build_url(config)
+    # Готовые байты уходят текстовым фреймом без повторного кодирования.
+    packet = Message(message, payload).frame()
+    if not reuse:
+        ws = create_connection(url)
+        ws.send(packet)
+        ws.close()
+        return
+
+    ws = _get_connection(url)
+    try:
+        ws.send(packet)
+    except (OSError, WebSocketConnectionClosedException):
+        # Сохраненное соединение было закрыто другой стороной.
+        _conn_cache.pop(url, None)
+        ws.close()
+        _get_connection(url).send(packet)
+
+
+def send_many(messages: list[Message], config=None) -> None:
+    """Отправляет несколько сообщений через одно соединение.
+
+    Фреймы всех сообщений склеиваются и записываются в сокет одним
+    системным вызовом.
+
+    Args:
+        messages (list[Message]): Отправляемые сообщения.
+        config (_type_, optional): конфиг.
+            По умолчанию None.
+    """
+    config = config or {}
 
-    ws = create_connection(url)
-    packet = Message(message, payload).serialize()
-    ws.send(packet)
-    ws.close()
+    frames = [_serializer_for(type(m))(m) for m in messages]
+    ws = create_connection(_build_url(config))
+    try:
+        _write_frames(ws, frames)
+    finally:
+        ws.close()
@@ -0,0 +1,52 @@
+"""
+Сериализация сообщений шины в json.
+
+Если установлен `orjson`, используется он, иначе стандартный `json`.
+Выбор выполняется один раз при импорте модуля.
+
+Данные, которые `orjson` сериализовать не может (например, целые шире
+64 бит), сериализуются стандартным `json`, как и до перехода на `orjson`.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _json_dumps(obj) -> bytes:
+    """Сериализует объект в json стандартным модулем `json`.
+
+    Args:
+        obj: сериализуемый объект.
+
+    Returns:
+        bytes: json в кодировке utf-8.
+    """
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+if orjson is not None:
+    # Ключи-не строки преобразуются в строки, как в стандартном json.
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj) -> bytes:
+        """Сериализует объект в json.
+
+        Args:
+            obj: сериализуемый объект.
+
+        Returns:
+            bytes: json в кодировке utf-8.
+        """
+        try:
+            return orjson.dumps(obj, option=_ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return _json_dumps(obj)
+
+    loads = orjson.loads
+
+else:  # pragma: no cover
+    dumps = _json_dumps
+    loads = json.loads
@@ -1,12 +1,17 @@
 """
 Утилиты для работы с шиной.
 """
-import json
 import logging
 from typing import Callable
 
+from .serialization import dumps, loads
 
-def create_echo_function(name: str) -> Callable[[str], None]:
+# Признаки сообщения регистрации в json без пробелов и с пробелами.
+_REGISTRATION_MARKERS = ('"type":"registration"', '"type": "registration"')
+_REGISTRATION_MARKERS_BYTES = tuple(m.encode() for m in _REGISTRATION_MARKERS)
+
+
+def create_echo_function(name: str) -> Callable[[str | bytes], None]:
     """Стандартный механизм логирования на платформе.
 
     Args:
@@ -17,13 +22,22 @@ def create_echo_function(name: str) -> Callable[[str], None]:
     """
     log = logging.getLogger(name)
 
-    def echo(message: str) -> None:
+    def echo(message: str | bytes) -> None:
+        # Разбирается только регистрация: в ней нужно скрыть токен.
+        compact, spaced = (
+            _REGISTRATION_MARKERS_BYTES
+            if isinstance(message, bytes)
+            else _REGISTRATION_MARKERS
+        )
+        if compact not in message and spaced not in message:
+            log.info("MESSAGEBUS: %s", repr(message))
+            return
         try:
-            msg = json.loads(message)
+            msg = loads(message)
             message_type = msg.get("type", "")
             if message_type == "registration":
                 msg["data"]["token"] = None
-                message = json.dumps(msg)
+                message = dumps(msg).decode()
         except Exception as exc:
             log.info("Error: %s", repr(exc), exc_info=True)
 
@@ -22,6 +22,7 @@ setup(
     packages=find_packages(),
     version="0.1.1",
     # install_requires=required("requirements.txt"),
+    extras_require={"async": ["websockets"]},
     author="Alexander Belinsky",
     author_email="belinskyab@mail.ru",
     description="Alena MessageBus Client",
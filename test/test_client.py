@@ -1,9 +1,22 @@
+import asyncio
+import socket
+import time
+from threading import Lock, Timer
 from unittest.mock import Mock
 
+import pytest
 from pyee import ExecutorEventEmitter
+from websocket import WebSocketTimeoutException
 
 from alena_messagebus_client import MessageBusClient, Message
-from alena_messagebus_client.client import MessageWaiter, MessageCollector
+from alena_messagebus_client.client import (
+    AsyncMessageBusClient,
+    DirectEmitter,
+    MessageCollector,
+    MessageWaiter,
+)
+from alena_messagebus_client import send_message
+from alena_messagebus_client.client.client import _write_frames
 
 
 WS_CONF = {
@@ -16,6 +29,17 @@ WS_CONF = {
 }
 
 
+@pytest.fixture(scope="module")
+def mock_bus():
+    return Mock()
+
+
+@pytest.fixture
+def bus(mock_bus):
+    mock_bus.reset_mock()
+    return mock_bus
+
+
 class TestMessageBusClient:
     def test_build_url(self):
         url = MessageBusClient.build_url("localhost", 1337, "/core", False)
@@ -31,15 +55,333 @@ class TestMessageBusClient:
         mc = MessageBusClient()
         assert isinstance(mc.emitter, ExecutorEventEmitter)
 
+    def test_create_client_direct_dispatch(self):
+        mc = MessageBusClient(direct_dispatch=True)
+        assert isinstance(mc.emitter, DirectEmitter)
+
     def test_create_client_custom_executor(self):
         mock_emitter = Mock()
         mc = MessageBusClient(emitter=mock_emitter)
         assert mc.emitter == mock_emitter
 
+    def test_serialize_without_serialize_method(self):
+        class SlottedMessage:
+            __slots__ = ("message_type", "payload", "context")
+
+            def __init__(self):
+                self.message_type = "slotted"
+                self.payload = {"a": 1}
+                self.context = {}
+
+        frame = MessageBusClient._serialize(SlottedMessage())
+        msg = Message.deserialize(frame)
+        assert msg.message_type == "slotted"
+        assert msg.payload == {"a": 1}
+
+    def test_invalid_flush_mode(self):
+        with pytest.raises(ValueError):
+            MessageBusClient(flush_mode="sometimes")
+
+    def test_invalid_flush_batch(self):
+        with pytest.raises(ValueError):
+            MessageBusClient(flush_batch=0)
+
+    def test_emit_many_coalesce(self):
+        mc = MessageBusClient(flush_mode="coalesce", flush_batch=2)
+        mc.connected_event.set()
+        mc._send_frames = Mock()
+        mc._start_writer()
+        mc.emit_many([Message("test.{}".format(i)) for i in range(5)])
+        assert mc.flush(timeout=1)
+
+        batches = [call.args[0] for call in mc._send_frames.call_args_list]
+        sent = [Message.deserialize(f) for batch in batches for f in batch]
+        assert [m.message_type for m in sent] == [
+            "test.{}".format(i) for i in range(5)
+        ]
+        assert all(len(batch) <= 2 for batch in batches)
+        mc.close()
+
+    def test_writer_survives_send_errors(self, monkeypatch):
+        mc = MessageBusClient(flush_mode="coalesce")
+        mc.connected_event.set()
+        write = Mock(side_effect=[WebSocketTimeoutException("timeout"), None])
+        monkeypatch.setattr(
+            "alena_messagebus_client.client.client._write_frames", write
+        )
+        mc._start_writer()
+        mc.emit(Message("test.1"))
+        assert mc.flush(timeout=1)
+        mc.emit(Message("test.2"))
+        assert mc.flush(timeout=1)
+        assert mc._writer.is_alive()
+        assert write.call_count == 2
+        mc.close()
+
+    def test_on_collect_fast_ack(self):
+        mc = MessageBusClient(emitter=Mock())
+        mc.connected_event.set()
+        mc.client = Mock()
+        handler = Mock()
+        mc.on_collect("test.collect", handler, timeout=1.5)
+
+        msg = Message(
+            "test.collect",
+            context={
+                "__collect_id__": "query1",
+                "source": "earth",
+                "destination": "mars",
+            },
+        )
+        mc.wrapped_funcs[handler](msg)
+
+        handler_id = handler.call_args.args[0].handler_id
+        ack = Message.deserialize(mc.client.send.call_args.args[0])
+        expected = msg.reply(
+            "test.collect.handling",
+            payload={
+                "query": "query1",
+                "handler": handler_id,
+                "timeout": 1.5,
+            },
+        )
+        assert ack.message_type == expected.message_type
+        assert ack.payload == expected.payload
+        assert ack.context == expected.context
+
+    def test_collect_responses_loopback(self):
+        mc = MessageBusClient(direct_dispatch=True)
+        mc._connected = True
+        mc.client = Mock()
+        mc.client.send.side_effect = lambda frame: mc.on_message(frame)
+        mc.on_collect(
+            "test.collect", lambda m: mc.emit(m.success({"answer": 42}))
+        )
+
+        responses = mc.collect_responses(
+            Message("test.collect"), min_timeout=0.0, max_timeout=1.0
+        )
+        assert len(responses) == 1
+        assert responses[0].message_type == "test.collect.response"
+        assert responses[0].payload["answer"] == 42
+        assert responses[0].payload["succeeded"] is True
+
+    def test_retry_backoff(self):
+        mc = MessageBusClient()
+        assert 3.75 <= mc._next_retry_delay() <= 6.25
+        assert 7.5 <= mc._next_retry_delay() <= 12.5
+        assert mc.connect_attempts == 2
+
+        # Ошибка на установленном соединении не увеличивает задержку
+        mc.client.sock = Mock()
+        mc.on_open()
+        assert 7.5 * 2 <= mc._next_retry_delay() <= 12.5 * 2
+        assert mc.retry == 20
+
+        # После долгой работы задержка сбрасывается
+        mc.on_open()
+        mc._connected_since -= 60
+        assert 3.75 <= mc._next_retry_delay() <= 6.25
+        assert mc.connect_attempts == 0
+
+    def test_run_forever_reconnects_iteratively(self):
+        emitter = Mock()
+        mc = MessageBusClient(emitter=emitter)
+        failing = Mock()
+        failing.run_forever.return_value = True
+        healthy = Mock()
+        healthy.run_forever.return_value = False
+        mc.client = failing
+        mc.create_client = Mock(side_effect=[failing, healthy])
+        mc._next_retry_delay = Mock(return_value=0)
+
+        mc.run_forever()
+
+        assert mc.create_client.call_count == 2
+        assert mc.client is healthy
+        emitter.emit.assert_called_with("reconnecting")
+
+    def test_close_interrupts_reconnect_delay(self):
+        mc = MessageBusClient(emitter=Mock())
+        mc.client = Mock()
+        mc._next_retry_delay = Mock(return_value=30)
+        Timer(0.1, mc.close).start()
+
+        start = time.monotonic()
+        mc._handle_reconnect()
+        assert time.monotonic() - start < 5
+        mc.emitter.emit.assert_not_called()
+
+    def test_on_error_requests_reconnect(self):
+        mc = MessageBusClient(emitter=Mock())
+        mc.client = Mock()
+        mc.on_error(mc.client, ConnectionRefusedError())
+        assert mc._reconnect_requested
+        mc.client.close.assert_called_once_with()
+
+    def test_raw_message_only_with_listener(self):
+        mc = MessageBusClient(direct_dispatch=True)
+        handler = Mock()
+        raw_handler = Mock()
+        mc.on("test", handler)
+        frame = Message("test").serialize()
+
+        mc.on_message(frame)
+        assert not mc._has_raw_listener
+        handler.assert_called_once()
+
+        mc.on("message", raw_handler)
+        mc.on_message(frame)
+        raw_handler.assert_called_once_with(frame)
+
+        mc.remove("message", raw_handler)
+        assert not mc._has_raw_listener
+
+    def test_non_str_event_name(self):
+        mc = MessageBusClient(direct_dispatch=True)
+        handler = Mock()
+        mc.on(42, handler)
+        mc.emitter.emit(42, "data")
+        handler.assert_called_once_with("data")
+        mc.remove(42, handler)
+
+    def test_on_open_sets_nodelay(self):
+        mc = MessageBusClient()
+        mc.client.sock = Mock()
+        mc.on_open()
+        mc.client.sock.sock.setsockopt.assert_called_with(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1
+        )
+        assert mc.connected_event.is_set()
+
+    def test_write_frames_single_send(self):
+        ws = Mock()
+        ws.connected = True
+        ws.get_mask_key = None
+        ws.lock = Lock()
+        ws._send.side_effect = len
+        cork = Mock()
+        frames = [Message("a").serialize(), Message("b").serialize()]
+        _write_frames(ws, frames, cork)
+        assert ws._send.call_count == 1
+        cork.assert_not_called()
+
+        # Частичная запись: остаток дописывается под TCP_CORK.
+        ws._send.reset_mock()
+        ws._send.side_effect = lambda data: min(len(data), 4)
+        _write_frames(ws, frames, cork)
+        assert ws._send.call_count > 1
+        assert cork.call_args_list == [((1,),), ((0,),)]
+
+
+class TestSendMessage:
+    def test_send_reuse(self, monkeypatch):
+        ws = Mock(connected=True)
+        create = Mock(return_value=ws)
+        monkeypatch.setattr(send_message, "create_connection", create)
+        monkeypatch.setattr(send_message, "_conn_cache", {})
+
+        config = WS_CONF["websocket"]
+        send_message.send("test", config=config, reuse=True)
+        send_message.send("test", config=config, reuse=True)
+        create.assert_called_once_with("ws://testhost:1337/core")
+        assert ws.send.call_count == 2
+        assert isinstance(ws.send.call_args.args[0], bytes)
+        ws.close.assert_not_called()
+
+        send_message._close_all()
+        ws.close.assert_called_once()
+
+    def test_send_many(self, monkeypatch):
+        ws = Mock(connected=True, lock=Lock(), get_mask_key=None)
+        ws._send.side_effect = len
+        create = Mock(return_value=ws)
+        monkeypatch.setattr(send_message, "create_connection", create)
+
+        send_message.send_many(
+            [Message("a"), Message("b")], {"host": "h", "port": 1}
+        )
+        create.assert_called_once()
+        ws._send.assert_called_once()
+        ws.close.assert_called_once()
+
+
+class TestDirectEmitter:
+    def test_on_and_remove(self):
+        emitter = DirectEmitter()
+        handler = Mock()
+        emitter.on("test", handler)
+        assert emitter.emit("test", 1)
+        handler.assert_called_once_with(1)
+
+        emitter.remove_listener("test", handler)
+        assert "test" not in emitter._events
+        assert not emitter.emit("test", 2)
+        with pytest.raises(ValueError):
+            emitter.remove_listener("test", handler)
+
+    def test_once(self):
+        emitter = DirectEmitter()
+        handler = Mock()
+        emitter.once("test", handler)
+        emitter.emit("test")
+        emitter.emit("test")
+        assert handler.call_count == 1
+
+    def test_handler_error_does_not_stop_dispatch(self):
+        emitter = DirectEmitter()
+        handler = Mock()
+        emitter.on("test", Mock(side_effect=RuntimeError))
+        emitter.on("test", handler)
+        emitter.emit("test")
+        handler.assert_called_once_with()
+
+
+class TestAsyncMessageBusClient:
+    def test_wait_for_response(self):
+        websockets = pytest.importorskip("websockets")
+
+        async def respond(ws):
+            async for frame in ws:
+                response = Message.deserialize(frame).response()
+                await ws.send("not json")  # не должен разорвать соединение
+                await ws.send(response.serialize())
+
+        async def scenario():
+            async with websockets.serve(respond, "127.0.0.1", 0) as server:
+                port = server.sockets[0].getsockname()[1]
+                client = AsyncMessageBusClient("127.0.0.1", port, "/core")
+                runner = asyncio.ensure_future(client.run_forever())
+                response = await client.wait_for_response(Message("ping"))
+                await client.close()
+                await runner
+                return response
+
+        response = asyncio.run(scenario())
+        assert response.message_type == "ping.response"
+
+    def test_retry_backoff(self):
+        pytest.importorskip("websockets")
+        client = AsyncMessageBusClient()
+        assert 3.75 <= client._next_retry_delay() <= 6.25
+        assert 7.5 <= client._next_retry_delay() <= 12.5
+        for _ in range(10):
+            client._next_retry_delay()
+        assert client.retry == 60
+
+    def test_once_handler(self):
+        pytest.importorskip("websockets")
+        client = AsyncMessageBusClient()
+        handler = Mock()
+        client.once("test", handler)
+        client.on_message(Message("test").serialize())
+        client.on_message(Message("test").serialize())
+        assert handler.call_count == 1
+        assert "test" not in client.handlers
+
 
 class TestMessageWaiter:
-    def test_message_wait_success(self):
-        bus = Mock()
+    def test_message_wait_success(self, bus):
         waiter = MessageWaiter(bus, "delayed.message")
         bus.once.assert_called_with("delayed.message", waiter._handler)
 
@@ -48,66 +390,139 @@ class TestMessageWaiter:
 
         assert waiter.wait() == test_msg
 
-    def test_message_wait_timeout(self):
-        bus = Mock()
+    def test_message_wait_timeout(self, bus):
         waiter = MessageWaiter(bus, "delayed.message")
         bus.once.assert_called_with("delayed.message", waiter._handler)
 
         assert waiter.wait(0.3) is None
+        assert waiter.wait(-1) is None
+        assert waiter.wait(-0.5) is None
+        bus.remove.assert_called_once_with("delayed.message", waiter._handler)
+
+    def test_acquire_reuses_released_waiter(self, bus):
+        with MessageWaiter.acquire(bus, "delayed.message") as waiter:
+            test_msg = Mock(name="test_msg")
+            waiter._handler(test_msg)  # Inject response
+            assert waiter.wait() == test_msg
+
+        reused = MessageWaiter.acquire(bus, "other.message")
+        assert reused is waiter
+        assert reused.received_msg is None
+        assert reused.wait(0.05) is None
+        bus.once.assert_called_with("other.message", reused._handler)
+
+    def test_timed_out_waiter_not_pooled(self, bus):
+        with MessageWaiter.acquire(bus, "delayed.message") as waiter:
+            assert waiter.wait(0.1) is None
+        assert MessageWaiter.acquire(bus, "delayed.message") is not waiter
 
 
 class TestMessageCollector:
-    def test_message_wait_success(self):
-        bus = Mock()
+    @pytest.mark.parametrize("extra_invalid", [False, True])
+    def test_message_collect(self, bus, extra_invalid):
         collector = MessageCollector(
             bus, Message("delayed.message"), min_timeout=0.0, max_timeout=2.0
         )
 
-        test_register = Mock(name="test_register")
-        test_register.data = {
+        valid_register = Mock(name="valid_register")
+        valid_register.payload = {
             "query": collector.collect_id,
             "timeout": 5,
             "handler": "test_handler1",
         }
-        collector._register_handler(test_register)  # Inject response
+        collector._register_handler(valid_register)  # Inject response
+        if extra_invalid:
+            invalid_register = Mock(name="invalid_register")
+            invalid_register.payload = {
+                "query": "asdf",
+                "timeout": 5,
+                "handler": "test_handler1",
+            }
+            collector._register_handler(invalid_register)
 
-        test_response = Mock(name="test_register")
-        test_response.data = {
+        valid_response = Mock(name="valid_response")
+        valid_response.payload = {
             "query": collector.collect_id,
             "handler": "test_handler1",
         }
-        collector._receive_response(test_response)
+        collector._receive_response(valid_response)
+        if extra_invalid:
+            invalid_response = Mock(name="invalid_response")
+            invalid_response.payload = {
+                "query": "asdf",
+                "handler": "test_handler1",
+            }
+            collector._receive_response(invalid_response)
+
+        assert collector.collect() == [valid_response]
 
-        assert collector.collect() == [test_response]
+    def test_reused_message_gets_new_collect_id(self, bus):
+        message = Message("delayed.message")
+        MessageCollector(bus, message, min_timeout=0.0, max_timeout=1.0)
+        message.frame()
+        second = MessageCollector(
+            bus, message, min_timeout=0.0, max_timeout=1.0
+        )
+        sent = Message.deserialize(message.frame())
+        assert sent.context["__collect_id__"] == second.collect_id
 
-    def test_message_drop_invalid(self):
-        bus = Mock()
+    def test_message_wait_handler_timeout(self, bus):
         collector = MessageCollector(
             bus, Message("delayed.message"), min_timeout=0.0, max_timeout=2.0
         )
 
-        valid_register = Mock(name="valid_register")
-        valid_register.data = {
+        test_register = Mock(name="test_register")
+        test_register.payload = {
             "query": collector.collect_id,
-            "timeout": 5,
+            "timeout": 0.2,
             "handler": "test_handler1",
         }
-        invalid_register = Mock(name="invalid_register")
-        invalid_register.data = {
-            "query": "asdf",
+        collector._register_handler(test_register)  # Inject response
+
+        start = time.monotonic()
+        assert collector.collect() == []
+        assert 0.2 <= time.monotonic() - start < 1.0
+
+    def test_wait_shrinks_after_longest_handler_answers(self, bus):
+        collector = MessageCollector(
+            bus, Message("delayed.message"), min_timeout=0.0, max_timeout=5.0
+        )
+        query = collector.collect_id
+        for handler, timeout in (("slow", 3), ("silent", 0.5)):
+            collector._register_handler(
+                Message(
+                    "delayed.message.handling",
+                    {"query": query, "handler": handler, "timeout": timeout},
+                )
+            )
+        response = Message(
+            "delayed.message.response", {"query": query, "handler": "slow"}
+        )
+        Timer(0.1, collector._receive_response, (response,)).start()
+
+        start = time.monotonic()
+        assert collector.collect() == [response]
+        assert 0.5 <= time.monotonic() - start < 1.5
+
+    def test_iterate_responses(self, bus):
+        collector = MessageCollector(
+            bus, Message("delayed.message"), min_timeout=0.0, max_timeout=2.0
+        )
+        assert collector.poll() is None
+
+        test_register = Mock(name="test_register")
+        test_register.payload = {
+            "query": collector.collect_id,
             "timeout": 5,
             "handler": "test_handler1",
         }
-        collector._register_handler(valid_register)  # Inject response
-        collector._register_handler(invalid_register)  # Inject response
+        collector._register_handler(test_register)  # Inject response
 
-        valid_response = Mock(name="valid_register")
-        valid_response.data = {
+        test_response = Mock(name="test_response")
+        test_response.payload = {
             "query": collector.collect_id,
             "handler": "test_handler1",
         }
-        invalid_response = Mock(name="invalid_register")
-        invalid_response.data = {"query": "asdf", "handler": "test_handler1"}
-        collector._receive_response(valid_response)
-        collector._receive_response(invalid_response)
-        assert collector.collect() == [valid_response]
+        collector._receive_response(test_response)
+
+        assert list(collector) == [test_response]
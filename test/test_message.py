@@ -1,3 +1,6 @@
+import json
+import pickle
+from copy import deepcopy
 from time import time
 from unittest import TestCase
 
@@ -32,6 +35,54 @@ class TestMessage(TestCase):
         self.assertEqual(source.payload, reassembled.data)
         self.assertEqual(source.context, reassembled.context)
 
+    def test_deserialize_bytes(self):
+        """Проверяет, что сообщение восстанавливается из bytes."""
+        msg = Message.deserialize(
+            '{"type": "тест", "payload": {"a": 1}}'.encode("utf-8")
+        )
+        self.assertEqual(msg.message_type, "тест")
+        self.assertEqual(msg.payload, {"a": 1})
+        self.assertEqual(msg.context, {})
+
+    def test_serialize_cached(self):
+        """Проверяет кэширование и сброс кэша при присваивании."""
+        msg = Message("test_type", {"robot": "marvin"})
+        first = msg.frame()
+        self.assertIs(first, msg.frame())
+        self.assertEqual(first.decode(), msg.serialize())
+
+        msg.message_type = "speak"
+        reassembled = Message.deserialize(msg.serialize())
+        self.assertEqual(reassembled.message_type, "speak")
+
+    def test_serialize_stdlib_compatible(self):
+        """Проверяет данные, которые принимал стандартный json."""
+        msg = Message("test_type", {1: "a", "big": 2**70})
+        restored = Message.deserialize(msg.serialize())
+        self.assertEqual(restored.payload, {"1": "a", "big": 2**70})
+
+    def test_frame_non_str_keys(self):
+        """Проверяет ключи-не строки в контексте фрейма."""
+        msg = Message("test_type", context={2: "b"})
+        restored = Message.deserialize(msg.frame())
+        self.assertEqual(restored.context, {"2": "b"})
+
+    def test_slots(self):
+        """Проверяет, что у сообщений нет словаря атрибутов."""
+        msg = Message("test_type")
+        self.assertFalse(hasattr(msg, "__dict__"))
+        with self.assertRaises(AttributeError):
+            msg.extra = 1
+
+    def test_default_payload_copy_and_pickle(self):
+        """Проверяет копирование сообщения со значениями по умолчанию."""
+        msg = Message("test_type")
+        msg.payload["key"] = 1
+        self.assertEqual(Message("other").payload, {})
+        for restored in (deepcopy(msg), pickle.loads(pickle.dumps(msg))):
+            self.assertEqual(restored.serialize(), msg.serialize())
+        self.assertEqual(json.loads(json.dumps(msg.context)), {})
+
     def test_response(self):
         """Проверяет, что .response добавляется к сообщению при ответе."""
         source = Message(
@@ -64,6 +115,17 @@ class TestMessage(TestCase):
         response_msg = source.response()
         self.assertEqual(response_msg.context, reply_msg.context)
 
+    def test_reply_copies_payload_and_context(self):
+        """Проверяет, что ответ не разделяет вложенные данные с исходными."""
+        payload = {"items": [{"a": 1}]}
+        source = Message("test_type", context={"session": {"id": 1}})
+        reply_msg = source.reply("reply_type", payload)
+
+        payload["items"][0]["a"] = 2
+        source.context["session"]["id"] = 2
+        self.assertEqual(reply_msg.payload, {"items": [{"a": 1}]})
+        self.assertEqual(reply_msg.context, {"session": {"id": 1}})
+
     def test_dig_for_message_simple(self):
         test_msg = Message("test message", {"test": "data"}, {"time": time()})
         self.assertEqual(test_msg, get_message_standard(test_msg))
@@ -98,6 +160,22 @@ class TestMessage(TestCase):
 
         self.assertIsNone(wrapper_method(dict()))
 
+    def test_dig_for_message_kwonly_and_depth(self):
+        message = Message("test message")
+
+        def kwonly(*, msg):
+            return dig_for_message()
+
+        self.assertEqual(kwonly(msg=message), message)
+
+        def deep(msg, depth):
+            if depth:
+                return deep(None, depth - 1)
+            return dig_for_message(max_records=3)
+
+        self.assertEqual(deep(message, 2), message)
+        self.assertIsNone(deep(message, 3))
+
     def test_dig_for_message_no_method_call(self):
         _ = Message("test message", {"test": "data"}, {"time": time()})
         self.assertIsNone(dig_for_message())